@@ -1,8 +1,8 @@
 from .__version__ import __version__
 
-from .query import BulkUpdateOrCreateQuerySet, BulkUpdateOrCreateMixin
+from .query import BulkUpdateOrCreateQuerySet, BulkUpdateOrCreateMixin, with_related
 
-__all__ = ['BulkUpdateOrCreateQuerySet', 'BulkUpdateOrCreateMixin']
+__all__ = ['BulkUpdateOrCreateQuerySet', 'BulkUpdateOrCreateMixin', 'with_related']
 
 
 default_app_config = 'bulk_update_or_create.apps.BulkUpdateOrCreateConfig'
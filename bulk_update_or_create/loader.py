@@ -0,0 +1,262 @@
+import csv
+import gzip
+import json
+import multiprocessing
+from queue import Empty
+from time import time
+from typing import Any, Callable, Dict, Generator, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from django.core.exceptions import ValidationError
+from django.db.models import Model, QuerySet
+
+from .query import BulkUpdateOrCreateQuerySet
+
+FORMATS = ('csv', 'jsonl')
+
+FieldMapping = Dict[str, Union[str, Tuple[str, Callable[[Any], Any]]]]
+
+
+class BatchProgress(NamedTuple):
+    batch: int
+    rows: int
+    created: int
+    updated: int
+    elapsed: float
+    stale: int = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith('.gz') else path
+    for fmt in FORMATS:
+        if name.endswith(f'.{fmt}'):
+            return fmt
+    raise ValueError(f'Cannot detect format of {path}, use one of {", ".join(FORMATS)}.')
+
+
+def open_text(path: str):
+    """
+    open `path` for reading text, decompressing it if it is gzipped.
+    A UTF-8 BOM (as written by some spreadsheet tools) is skipped, so it does not end up in the first CSV header
+    """
+    with open(path, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+    if gzipped:
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def iter_rows(path: str, format: Optional[str] = None, **csv_options: Any) -> Generator[Dict[str, Any], None, None]:
+    """
+    Incrementally read rows (as dicts) from a CSV or JSONL file (optionally gzipped)
+
+    :param path: file to read
+    :param format: "csv" or "jsonl" (detected from file extension if not set)
+    :param csv_options: passed on to `csv.DictReader`
+    """
+    format = format or detect_format(path)
+    if format not in FORMATS:
+        raise ValueError(f'format must be one of {", ".join(FORMATS)}.')
+    with open_text(path) as f:
+        if format == 'csv':
+            yield from csv.DictReader(f, **csv_options)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _iter_chunks(rows: Iterable[Dict[str, Any]], chunk_size: int) -> Generator[List[Dict[str, Any]], None, None]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parse_worker(queue, path, format, chunk_size, csv_options):
+    try:
+        for chunk in _iter_chunks(iter_rows(path, format, **csv_options), chunk_size):
+            queue.put(chunk)
+    except Exception as e:
+        queue.put(e)
+    else:
+        queue.put(None)
+
+
+def iter_rows_parallel(
+    path: str,
+    format: Optional[str] = None,
+    chunk_size: int = 1000,
+    max_chunks: int = 4,
+    **csv_options: Any,
+) -> Generator[Dict[str, Any], None, None]:
+    """
+    Same as `iter_rows` but parsing runs in a separate process.
+    At most `max_chunks` chunks of `chunk_size` rows are buffered, so memory stays bounded
+    """
+    queue = multiprocessing.Queue(maxsize=max_chunks)
+    process = multiprocessing.Process(target=_parse_worker, args=(queue, path, format, chunk_size, csv_options))
+    process.daemon = True
+    process.start()
+    try:
+        while True:
+            try:
+                chunk = queue.get(timeout=1)
+            except Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f'Parser process for {path} exited unexpectedly.')
+                continue
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield from chunk
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+
+class RowConverter:
+    """
+    Build model instances from rows.
+
+    :param model: model class
+    :param fields: mapping of model field names to row keys, or to (row key, converter) tuples, eg:
+        {"uuid": ("id", int), "data": "name"}
+        If not set, row keys that match model field names (or attnames, eg: "parent_id") are used.
+        Keys missing from a row are skipped, so model defaults apply. Values without a converter are coerced
+        with the model field `to_python`, empty strings become None for nullable fields.
+        Values that cannot be converted raise ValueError, with the row number if given
+    """
+
+    def __init__(self, model: Model, fields: Optional[FieldMapping] = None):
+        self.model = model
+        self._mapping = None if fields is None else self._build_mapping(fields)
+        self._by_name = {}
+        for field in self.model._meta.concrete_fields:
+            self._by_name[field.name] = field
+            self._by_name[field.attname] = field
+
+    def _build_mapping(self, fields: FieldMapping):
+        mapping = []
+        for name, source in fields.items():
+            field = self.model._meta.get_field(name)
+            if isinstance(source, str):
+                source, converter = source, None
+            else:
+                source, converter = source
+            mapping.append((field, source, converter))
+        return mapping
+
+    def _row_mapping(self, row: Dict[str, Any]):
+        if self._mapping is not None:
+            return self._mapping
+        # rows (JSONL) do not necessarily share the same keys
+        return [(self._by_name[k], k, None) for k in row if k in self._by_name]
+
+    def __call__(self, row: Dict[str, Any], number: Optional[int] = None) -> Model:
+        """
+        :param row: row to convert
+        :param number: position of the row in the file (starting at 1), reported in errors
+        """
+        kwargs = {}
+        for field, source, converter in self._row_mapping(row):
+            if source not in row:
+                continue
+            value = row[source]
+            try:
+                if converter is not None:
+                    value = converter(value)
+                elif value == '' and field.null:
+                    value = None
+                elif value is not None and not field.is_relation:
+                    value = field.to_python(value)
+            except (ValidationError, ValueError, TypeError) as e:
+                message = '; '.join(e.messages) if isinstance(e, ValidationError) else str(e)
+                where = '' if number is None else f' in row {number}'
+                raise ValueError(f'Invalid {source} for {field.name}{where}: {message}') from e
+            kwargs[field.attname] = value
+        return self.model(**kwargs)
+
+
+def load(
+    model_or_queryset: Union[Model, QuerySet],
+    path: str,
+    update_fields: List[str],
+    match_field: str = 'pk',
+    fields: Optional[FieldMapping] = None,
+    format: Optional[str] = None,
+    batch_size: int = 500,
+    parallel: bool = False,
+    progress_cb: Optional[Callable[[BatchProgress], Any]] = None,
+    csv_options: Optional[Dict[str, Any]] = None,
+    **kwargs: Any,
+) -> BatchProgress:
+    """
+    Stream a CSV or JSONL file (optionally gzipped) into a model using `bulk_update_or_create_context`.
+    Only one batch is kept in memory at a time.
+
+    :param model_or_queryset: target model (or queryset). It does not need to use `BulkUpdateOrCreateQuerySet`
+    :param path: file to load
+    :param update_fields: fields that will be updated if record already exists
+    :param match_field: model field that will match existing records (defaults to "pk")
+    :param fields: declarative mapping of model fields to row keys and converters, see `RowConverter`
+    :param format: "csv" or "jsonl" (detected from file extension if not set)
+    :param batch_size: number of records to process in each batch (defaults to 500)
+    :param parallel: parse the file in a separate process (defaults to False)
+    :param progress_cb: called with a `BatchProgress` after each batch
+    :param csv_options: passed on to `csv.DictReader`
+    :param kwargs: passed on to `bulk_update_or_create_context`
+    :return: `BatchProgress` with totals
+    """
+    if isinstance(model_or_queryset, QuerySet):
+        queryset = model_or_queryset
+        model = queryset.model
+    else:
+        model = model_or_queryset
+        queryset = model._default_manager.all()
+    if not hasattr(queryset, 'bulk_update_or_create_context'):
+        queryset = BulkUpdateOrCreateQuerySet(model=model, using=queryset.db)
+
+    csv_options = csv_options or {}
+    if parallel:
+        rows = iter_rows_parallel(path, format, chunk_size=batch_size, **csv_options)
+    else:
+        rows = iter_rows(path, format, **csv_options)
+    converter = RowConverter(model, fields)
+
+    start = time()
+    totals = {'batch': 0, 'rows': 0, 'created': 0, 'updated': 0, 'stale': 0}
+
+    def _status(counts):
+        # stale is only reported when using update_if
+        created, updated, stale = (*counts, 0)[:3]
+        totals['batch'] += 1
+        totals['created'] += created
+        totals['updated'] += updated
+        totals['stale'] += stale
+        if progress_cb is not None:
+            progress_cb(BatchProgress(elapsed=time() - start, **totals))
+
+    with queryset.bulk_update_or_create_context(
+        update_fields,
+        match_field=match_field,
+        batch_size=batch_size,
+        status_cb=_status,
+        returning='counts',
+        **kwargs,
+    ) as bulkit:
+        for row in rows:
+            # counted when read: rows with the same match key in a batch are written once
+            totals['rows'] += 1
+            bulkit.queue(converter(row, totals['rows']))
+
+    return BatchProgress(elapsed=time() - start, **totals)
@@ -0,0 +1,77 @@
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from bulk_update_or_create.loader import FORMATS, load
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or JSONL file (optionally gzipped) into a model using bulk_update_or_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='target model, as app_label.ModelName')
+        parser.add_argument('path', help='file to load')
+        parser.add_argument(
+            '--update-fields', required=True, help='comma separated fields to update if record already exists'
+        )
+        parser.add_argument('--match-field', default='pk', help='comma separated fields to match existing records')
+        parser.add_argument(
+            '--update-if', help='only update records with a lower value in this field (eg: a timestamp or version)'
+        )
+        parser.add_argument(
+            '--map',
+            action='append',
+            default=[],
+            metavar='FIELD=COLUMN',
+            help='map a model field to a column (can be repeated), default is to use columns matching field names',
+        )
+        parser.add_argument('--format', choices=FORMATS, help='file format (detected from extension if not set)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--delimiter', default=',', help='CSV delimiter')
+        parser.add_argument('--parallel', action='store_true', help='parse the file in a separate process')
+
+    def _progress(self, progress):
+        self.stdout.write(
+            f'batch {progress.batch}: {progress.created} created, {progress.updated} updated, {progress.stale} stale, '
+            f'{progress.rows} rows in {progress.elapsed:.2f}s ({progress.rows_per_second:.0f} rows/s)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+
+        fields = None
+        if options['map']:
+            fields = {}
+            for mapping in options['map']:
+                field, sep, column = mapping.partition('=')
+                if not sep:
+                    raise CommandError(f'Invalid --map {mapping}, use FIELD=COLUMN')
+                fields[field] = column
+
+        match_field = options['match_field'].split(',')
+        try:
+            total = load(
+                model,
+                options['path'],
+                options['update_fields'].split(','),
+                match_field=match_field[0] if len(match_field) == 1 else match_field,
+                fields=fields,
+                format=options['format'],
+                batch_size=options['batch_size'],
+                parallel=options['parallel'],
+                progress_cb=self._progress,
+                csv_options={'delimiter': options['delimiter']},
+                update_if=options['update_if'],
+            )
+        except (OSError, ValueError, ObjectDoesNotExist) as e:
+            raise CommandError(str(e))
+        except ValidationError as e:
+            raise CommandError('; '.join(e.messages))
+
+        self.stdout.write(
+            f'done: {total.created} created, {total.updated} updated, {total.stale} stale, '
+            f'{total.rows} rows in {total.elapsed:.2f}s ({total.rows_per_second:.0f} rows/s)'
+        )
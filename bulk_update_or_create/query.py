@@ -1,8 +1,120 @@
 from types import TracebackType
-from typing import Any, Callable, Generator, List, Optional, Tuple, Type, Union
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, Type, Union
 
-from django.db import models
+from django.db import connections, models, transaction
 from django.db.models import Model, QuerySet
+from django.db.models.functions import Cast
+from django.db.models.lookups import In
+from django.db.models.sql.where import AND
+
+from .signals import post_bulk_upsert, pre_bulk_upsert
+
+_RETURNING_MODES = ('none', 'counts', 'pks', 'objects')
+_NESTED_ATTR = '_bulk_update_or_create_nested'
+
+
+def with_related(obj: Model, **related: List[Any]) -> Model:
+    """
+    Attach related objects to `obj` to be upserted after it, when using `nested` in `bulk_update_or_create`.
+    Keyword arguments are reverse foreign key names (list of child model instances) or many to many field
+    names (list of target model instances or pks)
+    """
+    setattr(obj, _NESTED_ATTR, related)
+    return obj
+
+
+class _StableIn(In):
+    """
+    `IN` lookup that keeps duplicated values, so padded lists keep their length (and SQL text).
+    Not registered, see `_stable_filter`
+    """
+
+    def process_rhs(self, compiler, connection):
+        if not self.rhs_is_direct_value():
+            return super().process_rhs(compiler, connection)
+        sqls, sqls_params = self.batch_process_rhs(compiler, connection, self.rhs)
+        return '(' + ', '.join(sqls) + ')', sqls_params
+
+
+class _StableAny(models.Lookup):
+    """
+    `= ANY(%s)` lookup with a single array parameter (PostgreSQL), same SQL template for any number of values.
+    Not registered, see `_stable_filter`
+    """
+
+    lookup_name = 'any'
+
+    def get_prep_lookup(self):
+        return [self.lhs.output_field.get_prep_value(v) for v in self.rhs]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        values = [self.lhs.output_field.get_db_prep_value(v, connection, prepared=True) for v in self.rhs]
+        return f'{lhs} = ANY(%s)', [*lhs_params, values]
+
+
+def _is_stale(field, stored_obj: Model, obj: Model) -> bool:
+    """
+    :return: True if `obj` value for `field` is not newer than the stored one (NULL is older than anything)
+    """
+    stored = getattr(stored_obj, field.attname)
+    # normalized like Django does before saving, eg: naive datetimes (or strings) become aware if USE_TZ is set
+    incoming = field.get_prep_value(getattr(obj, field.attname))
+    return stored is not None and (incoming is None or incoming <= stored)
+
+
+def _same_values(fields, stored_obj: Model, obj: Model) -> bool:
+    """
+    :return: True if `stored_obj` already holds the values of `obj` for `fields` (expressions are not compared)
+    """
+    for field in fields:
+        value = getattr(obj, field.attname)
+        if hasattr(value, 'resolve_expression'):
+            continue
+        if field.get_prep_value(getattr(stored_obj, field.attname)) != field.get_prep_value(value):
+            return False
+    return True
+
+
+def _is_unique(model, name: str) -> bool:
+    """
+    :return: True if `name` field of `model` is unique by itself (unique, unique_together or unconditional constraint)
+    """
+    opts = model._meta
+    if opts.get_field(name).unique:
+        return True
+    if any(tuple(fields) == (name,) for fields in opts.unique_together):
+        return True
+    return any(
+        isinstance(c, models.UniqueConstraint) and getattr(c, 'condition', None) is None and tuple(c.fields) == (name,)
+        for c in opts.constraints
+    )
+
+
+def _stable_size(n: int, max_size: int) -> int:
+    """
+    smallest power of two not lower than `n`, capped at `max_size`
+    """
+    size = 1
+    while size < n:
+        size *= 2
+    return max(min(size, max_size), n)
+
+
+def _stable_filter(queryset: QuerySet, field_name: str, values: List[Any], max_size: int) -> QuerySet:
+    """
+    Filter `queryset` on `field_name` being one of `values`, with a stable statement shape:
+    `= ANY(%s)` on PostgreSQL, otherwise `IN` padded (repeating the last value) to a power of two up to `max_size`.
+    Lookups are added to this queryset only, instead of registering them on every field
+    """
+    queryset = queryset.all()
+    lhs = queryset.query.resolve_ref(field_name)
+    if connections[queryset.db].vendor == 'postgresql':
+        lookup = _StableAny(lhs, values)
+    else:
+        lookup = _StableIn(lhs, values + values[-1:] * (_stable_size(len(values), max_size) - len(values)))
+    queryset.query.where.add(lookup, AND)
+    return queryset
 
 
 class BulkUpdateOrCreateMixin:
@@ -13,8 +125,15 @@ class BulkUpdateOrCreateMixin:
         batch_size: int = 100,
         case_insensitive_match: bool = False,
         status_cb: Optional[
-            Callable[[Tuple[List[Model], List[Model]]], Any]
+            Callable[[Tuple[Any, ...]], Any]
         ] = None,
+        returning: Optional[str] = None,
+        fk_lookups: Optional[Dict[str, str]] = None,
+        create_missing_fks: bool = False,
+        nested: Optional[Dict[str, Dict[str, Any]]] = None,
+        stable_batches: bool = False,
+        update_if: Optional[str] = None,
+        send_row_signals: bool = True,
     ):
         """
         Helper method that returns a context manager (_BulkUpdateOrCreateContextManager) that makes it easier to handle
@@ -26,9 +145,22 @@ class BulkUpdateOrCreateMixin:
         :param match_field: model field that will match existing records (defaults to "pk")
         :param batch_size: number of records to process in each batch (defaults to 100)
         :param case_insensitive_match: set to True if using MySQL with "ci" collations (defaults to False)
-        :param status_cb: if set to a callable, status_cb is called a tuple of lists with ([created],
-            [updated]) objects as they're yielded
+        :param status_cb: if set to a callable, status_cb is called with the tuple reported for each batch as
+            they're yielded (([created], [updated]) objects by default, see `returning`)
+        :param returning: what status_cb receives for each batch, see `bulk_update_or_create`
+            (defaults to "objects" if status_cb is set, "none" otherwise). "none" cannot be used with status_cb
+        :param fk_lookups: foreign keys given as natural keys, see `bulk_update_or_create`.
+            Resolved keys are cached for the lifetime of the context manager
+        :param create_missing_fks: bulk create related objects for unknown natural keys (defaults to False)
+        :param nested: related objects to upsert after each batch, see `bulk_update_or_create`.
+            Use `.queue(obj, **related)` to attach them
+        :param stable_batches: keep statement shapes stable across batches, see `bulk_update_or_create`
+        :param update_if: only update records with an older value in this field, see `bulk_update_or_create`
+        :param send_row_signals: save created objects one by one, sending pre_save/post_save, see
+            `bulk_update_or_create` (defaults to True)
         """
+        if status_cb is not None and returning == 'none':
+            raise ValueError('returning cannot be "none" when using status_cb.')
         return _BulkUpdateOrCreateContextManager(
             self,
             update_fields,
@@ -36,6 +168,14 @@ class BulkUpdateOrCreateMixin:
             status_cb=status_cb,
             match_field=match_field,
             case_insensitive_match=case_insensitive_match,
+            returning=returning,
+            fk_lookups=fk_lookups,
+            create_missing_fks=create_missing_fks,
+            fk_cache={} if fk_lookups else None,
+            nested=nested,
+            stable_batches=stable_batches,
+            update_if=update_if,
+            send_row_signals=send_row_signals,
         )
 
     def bulk_update_or_create(
@@ -46,9 +186,17 @@ class BulkUpdateOrCreateMixin:
         batch_size: int = 100,
         case_insensitive_match: bool = False,
         yield_objects: bool = False,
+        returning: Optional[str] = None,
+        fk_lookups: Optional[Dict[str, str]] = None,
+        create_missing_fks: bool = False,
+        fk_cache: Optional[Dict[Tuple[str, str], Dict[Any, Any]]] = None,
+        nested: Optional[Dict[str, Dict[str, Any]]] = None,
+        stable_batches: bool = False,
+        update_if: Optional[str] = None,
+        send_row_signals: bool = True,
     ) -> Union[
-            Generator[Tuple[List[Model], List[Model]], None, None],
-            List[Tuple[List[Model], List[Model]]]
+            Generator[Tuple[List[Any], ...], None, None],
+            List[Tuple[List[Any], ...]]
         ]:
         """
 
@@ -57,10 +205,56 @@ class BulkUpdateOrCreateMixin:
         :param match_field: model fields that will match existing records (defaults to ["pk"])
         :param batch_size: number of records to process in each batch (defaults to len(objs))
         :param case_insensitive_match: set to True if using MySQL with "ci" collations (defaults to False)
-        :param yield_objects: if True, method becomes a generator that will yield a tuple of lists
-            with ([created], [updated]) objects. This is one tuple per each `batch`. If this is False,
-            a single tuple of lists with ([created], [updated]) will be returned.
+        :param yield_objects: if True, method becomes a generator that will yield one tuple per each `batch`
+            (see `returning`). If this is False, a list of those tuples is returned instead, which is empty
+            unless `returning` is set.
+        :param returning: what is reported for each batch, one of:
+            "objects" - ([created], [updated]) model instances (default if yield_objects is True)
+            "pks" - ([created pks], [updated pks])
+            "counts" - (number of created, number of updated)
+            "none" - nothing is reported, batches are released as soon as they are written
+            (default if yield_objects is False)
+        :param fk_lookups: mapping of foreign key field names to a field of the related model, eg: {"parent": "ext_id"}.
+            `objs` hold that natural key in the foreign key attribute (`obj.parent_id = "EXT1"`) and each batch
+            resolves them with a single `__in` query. The related model field must be unique.
+            With `case_insensitive_match`, natural keys are matched (and cached) case insensitively too
+        :param create_missing_fks: if True, related objects for unknown natural keys are bulk created (with only
+            the natural key field set). Otherwise, DoesNotExist is raised (defaults to False)
+        :param fk_cache: dict used to cache resolved natural keys, pass the same one to share it across calls
+        :param nested: related objects attached with `with_related()` that are written once each batch is saved.
+            Maps relation names to options:
+            reverse foreign keys - kwargs for the `bulk_update_or_create` call on the children, eg:
+                {"children": {"update_fields": ["data"], "match_field": "uuid"}}
+                (children get their foreign key set to the parent, add it to update_fields to re-parent them)
+            many to many fields - {"remove": bool}, if True (default) links not attached are removed, eg:
+                {"tags": {}}
+            through rows are bulk created/deleted, so m2m_changed is not sent (custom through models and
+            symmetrical fields are not supported). Target objects must be saved already.
+            Each batch is written in a transaction, together with its nested objects
+        :param stable_batches: if True, the SELECT (single match_field only) and UPDATE statements are padded to a
+            few fixed sizes (powers of two up to batch_size) or, on PostgreSQL, use `= ANY(%s)` array parameters,
+            so the SQL templates repeat across batches (defaults to False).
+            This only saves parsing/planning where the driver prepares statements from the template: SQLite
+            (sqlite3 statement cache) and PostgreSQL with psycopg 3 server-side binding. psycopg2 and mysqlclient
+            interpolate parameters on the client, so the server still gets different SQL text for each batch
+        :param update_if: field (in update_fields) such as a timestamp or version, existing records are only
+            updated if the new value is greater than the stored one (or the stored one is NULL).
+            This is checked against the selected records and enforced in the UPDATE WHERE clause as well: records
+            rejected there (written concurrently with a newer value) are re-read and reported as stale too.
+            Records not updated are reported as stale: each batch reports ([created], [updated], [stale])
+        :param send_row_signals: if False, created objects are inserted with a single `bulk_create` per batch,
+            so pre_save/post_save are not sent and custom `Model.save()` methods are bypassed. It cannot be used
+            with multi-table inheritance models (not supported by `bulk_create`).
+            `pre_bulk_upsert`/`post_bulk_upsert` (from `bulk_update_or_create.signals`) are always sent once per
+            batch, use them to handle whole batches instead (defaults to True)
+
+        Existing records that already hold the values of `update_fields` are not written: they are sent as
+        `unchanged` to `pre_bulk_upsert`/`post_bulk_upsert` but still reported as updated by this method
         """
+        if returning is None:
+            returning = 'objects' if yield_objects else 'none'
+        if returning not in _RETURNING_MODES:
+            raise ValueError(f'returning must be one of {", ".join(_RETURNING_MODES)}.')
 
         r = self.__bulk_update_or_create(
             objs,
@@ -68,7 +262,14 @@ class BulkUpdateOrCreateMixin:
             match_field,
             batch_size,
             case_insensitive_match,
-            yield_objects,
+            returning,
+            fk_lookups=fk_lookups,
+            create_missing_fks=create_missing_fks,
+            fk_cache=fk_cache,
+            nested=nested,
+            stable_batches=stable_batches,
+            update_if=update_if,
+            send_row_signals=send_row_signals,
         )
         if yield_objects:
             return r
@@ -117,6 +318,171 @@ class BulkUpdateOrCreateMixin:
 
             return _obj_key_getter, _obj_filter
 
+    def __bulk_update(self, objs, fields, stable_size=None, update_if=None):
+        """
+        Same as `bulk_update` but:
+        * if `stable_size` is set, batches are padded (repeating the last object) to a few fixed sizes
+          so the UPDATE statements repeat exactly
+        * if `update_if` is set, rows are only updated if the stored value of that field is lower than the new one
+
+        :return: stored instances of the rows rejected by `update_if` in the UPDATE (written since they were selected)
+        """
+        connection = connections[self.db]
+        requires_casting = connection.features.requires_casted_case_in_updates
+
+        def _case(batch_objs, field):
+            when_statements = []
+            for obj in batch_objs:
+                attr = getattr(obj, field.attname)
+                if not hasattr(attr, 'resolve_expression'):
+                    attr = models.Value(attr, output_field=field)
+                when_statements.append(models.When(pk=obj.pk, then=attr))
+            case_statement = models.Case(*when_statements, output_field=field)
+            if requires_casting:
+                case_statement = Cast(case_statement, output_field=field)
+            return case_statement
+
+        param_fields = ['pk', 'pk'] + fields + ([update_if, update_if] if update_if else [])
+        batch_size = max(connection.ops.bulk_batch_size(param_fields, objs), 1)
+        if stable_size:
+            batch_size = min(stable_size, batch_size)
+        rejected = []
+        with transaction.atomic(using=self.db, savepoint=False):
+            for i in range(0, len(objs), batch_size):
+                batch_objs = objs[i : i + batch_size]
+                if stable_size:
+                    batch_objs += batch_objs[-1:] * (_stable_size(len(batch_objs), batch_size) - len(batch_objs))
+                    queryset = _stable_filter(self, 'pk', [obj.pk for obj in batch_objs], batch_size)
+                else:
+                    queryset = self.filter(pk__in=[obj.pk for obj in batch_objs])
+                update_kwargs = {field.attname: _case(batch_objs, field) for field in fields}
+                if update_if:
+                    queryset = queryset.filter(
+                        models.Q(**{f'{update_if.attname}__lt': _case(batch_objs, update_if)})
+                        | models.Q(**{f'{update_if.attname}__isnull': True})
+                    )
+                pks = {obj.pk for obj in batch_objs}
+                if queryset.update(**update_kwargs) < len(pks) and update_if:
+                    # only re-read when the guard rejected some rows: those with a value not older than ours,
+                    # unless they hold what we wrote (as the rows updated now do)
+                    batch_map = {obj.pk: obj for obj in batch_objs}
+                    for stored_obj in self.filter(pk__in=pks):
+                        obj = batch_map[stored_obj.pk]
+                        if _is_stale(update_if, stored_obj, obj) and not _same_values(fields, stored_obj, obj):
+                            rejected.append(stored_obj)
+        return rejected
+
+    def __resolve_fk_lookups(self, batch, fk_lookups, create_missing_fks, fk_cache, case_insensitive_match):
+        for name, lookup in fk_lookups.items():
+            field = self.model._meta.get_field(name)
+            related_model = field.related_model
+            lookup_field = related_model._meta.get_field(lookup)
+            target = field.target_field.attname
+            manager = related_model._base_manager.using(self.db)
+            cache = fk_cache.setdefault((related_model._meta.label, lookup), {})
+
+            def _key(value):
+                # same normalization as match keys, so "ci" collation matches are found in the cache
+                return value.lower() if case_insensitive_match and hasattr(value, 'lower') else value
+
+            # normalized key -> value as given (used to query and create)
+            keys = {}
+            for obj in batch:
+                value = getattr(obj, field.attname)
+                if value is not None:
+                    value = lookup_field.to_python(value)
+                    keys.setdefault(_key(value), value)
+
+            missing = set(keys).difference(cache)
+            if missing:
+                stored = manager.filter(**{f'{lookup}__in': [keys[k] for k in missing]}).values_list(lookup, target)
+                cache.update((_key(k), v) for k, v in stored)
+                missing.difference_update(cache)
+            if missing:
+                if not create_missing_fks:
+                    raise related_model.DoesNotExist(
+                        f'{related_model._meta.object_name} matching {lookup} in '
+                        f'{sorted(keys[k] for k in missing)} does not exist.'
+                    )
+                # re-select as not every backend sets pk on bulk_create
+                manager.bulk_create([related_model(**{lookup: keys[k]}) for k in missing])
+                stored = manager.filter(**{f'{lookup}__in': [keys[k] for k in missing]}).values_list(lookup, target)
+                cache.update((_key(k), v) for k, v in stored)
+
+            for obj in batch:
+                value = getattr(obj, field.attname)
+                if value is not None:
+                    setattr(obj, field.attname, cache[_key(lookup_field.to_python(value))])
+
+    def __bulk_update_or_create_nested(self, written, nested):
+        """
+        :param written: list of (related, db_obj) tuples, with objects attached by `with_related` and
+            the saved instance they belong to
+        """
+        for name, options in nested.items():
+            field = self.model._meta.get_field(name)
+            pairs = [(related[name], db_obj) for related, db_obj in written if name in related]
+            if not pairs:
+                continue
+
+            if field.many_to_many:
+                self.__sync_m2m(field, pairs, options.get('remove', True))
+                continue
+
+            fk = field.field
+            children = []
+            for related_objs, db_obj in pairs:
+                parent_value = getattr(db_obj, fk.target_field.attname)
+                for child in related_objs:
+                    setattr(child, fk.attname, parent_value)
+                    children.append(child)
+            if children:
+                BulkUpdateOrCreateQuerySet(model=field.related_model, using=self.db).bulk_update_or_create(
+                    children, **options
+                )
+
+    def __check_nested_m2m(self, batch, fields):
+        for obj in batch:
+            related = getattr(obj, _NESTED_ATTR, {})
+            for field in fields:
+                if any(isinstance(o, Model) and o.pk is None for o in related.get(field.name, ())):
+                    raise ValueError(f'nested {field.name} objects must be saved before they can be linked.')
+
+    def __sync_m2m(self, field, pairs, remove):
+        through = field.remote_field.through
+        source = through._meta.get_field(field.m2m_field_name())
+        target = through._meta.get_field(field.m2m_reverse_field_name())
+        manager = through._base_manager.using(self.db)
+
+        wanted = {}
+        for related_objs, db_obj in pairs:
+            links = wanted.setdefault(getattr(db_obj, source.target_field.attname), set())
+            links.update(
+                getattr(o, target.target_field.attname) if isinstance(o, Model) else target.target_field.to_python(o)
+                for o in related_objs
+            )
+
+        to_remove = []
+        existing = manager.filter(**{f'{source.attname}__in': wanted.keys()}).values_list(
+            'pk', source.attname, target.attname
+        )
+        for pk, source_value, target_value in existing:
+            links = wanted[source_value]
+            if target_value in links:
+                links.discard(target_value)
+            else:
+                to_remove.append(pk)
+
+        if remove and to_remove:
+            manager.filter(pk__in=to_remove).delete()
+        to_add = [
+            through(**{source.attname: source_value, target.attname: target_value})
+            for source_value, links in wanted.items()
+            for target_value in links
+        ]
+        if to_add:
+            manager.bulk_create(to_add)
+
     def __bulk_update_or_create(
         self,
         objs: List[Model],
@@ -124,9 +490,16 @@ class BulkUpdateOrCreateMixin:
         match_field: str = 'pk',
         batch_size: Optional[int] = None,
         case_insensitive_match: bool = False,
-        yield_objects: bool = False,
+        returning: str = 'none',
+        fk_lookups: Optional[Dict[str, str]] = None,
+        create_missing_fks: bool = False,
+        fk_cache: Optional[Dict[Tuple[str, str], Dict[Any, Any]]] = None,
+        nested: Optional[Dict[str, Dict[str, Any]]] = None,
+        stable_batches: bool = False,
+        update_if: Optional[str] = None,
+        send_row_signals: bool = True,
     ) -> Union[
-            Generator[Tuple[List[Model], List[Model]], None, None],
+            Generator[Tuple[List[Any], ...], None, None],
             None
         ]:
         # validations like bulk_update
@@ -141,6 +514,30 @@ class BulkUpdateOrCreateMixin:
             raise ValueError('bulk_update_or_create() can only be used with concrete fields.')
         if any(f.primary_key for f in _update_fields):
             raise ValueError('bulk_update_or_create() cannot be used with primary key fields.')
+        fk_lookups = fk_lookups or {}
+        _fk_fields = [self.model._meta.get_field(name) for name in fk_lookups]
+        if any(not f.concrete or not (f.many_to_one or f.one_to_one) for f in _fk_fields):
+            raise ValueError('fk_lookups can only be used with foreign key fields.')
+        if any(not _is_unique(f.related_model, lookup) for f, lookup in zip(_fk_fields, fk_lookups.values())):
+            raise ValueError('fk_lookups can only be used with unique fields of the related model.')
+        if fk_cache is None:
+            fk_cache = {}
+        _update_if = None
+        if update_if is not None:
+            if update_if not in update_fields:
+                raise ValueError('update_if must be one of update_fields.')
+            _update_if = self.model._meta.get_field(update_if)
+        nested = nested or {}
+        _nested_fields = [self.model._meta.get_field(name) for name in nested]
+        if any(not (f.one_to_many or (f.many_to_many and f.concrete)) for f in _nested_fields):
+            raise ValueError('nested can only be used with reverse foreign keys and many to many fields.')
+        if any(f.many_to_many and not f.remote_field.through._meta.auto_created for f in _nested_fields):
+            raise ValueError('nested cannot be used with many to many fields using a custom through model.')
+        if any(f.many_to_many and f.remote_field.symmetrical for f in _nested_fields):
+            raise ValueError('nested cannot be used with symmetrical many to many fields.')
+        _nested_m2m = [f for f in _nested_fields if f.many_to_many]
+        if not send_row_signals and self.model._meta.parents:
+            raise ValueError('send_row_signals=False cannot be used with multi-table inheritance models.')
 
         # generators not supported (for now?), as bulk_update doesn't either
         objs = list(objs)
@@ -155,26 +552,101 @@ class BulkUpdateOrCreateMixin:
         _obj_key_getter, _obj_filter = self.__bulk_update_or_create_inner_methods(_match_fields, case_insensitive_match)
 
         for batch in batches:
-            obj_map = {_obj_key_getter(obj): obj for obj in batch}
-
-            # mass select for bulk_update on existing ones
-            to_update = self.filter(_obj_filter(obj_map))
-
-            for to_u in to_update:
-                obj = obj_map[_obj_key_getter(to_u)]
-                for _f in update_fields:
-                    setattr(to_u, _f, getattr(obj, _f))
-                del obj_map[_obj_key_getter(to_u)]
-            self.bulk_update(to_update, update_fields)
+            # errors raised before the transaction, so they do not break the caller's one
+            if _nested_m2m:
+                self.__check_nested_m2m(batch, _nested_m2m)
+            if fk_lookups:
+                self.__resolve_fk_lookups(batch, fk_lookups, create_missing_fks, fk_cache, case_insensitive_match)
+
+            # parents and nested objects are written together (or not at all)
+            with transaction.atomic(using=self.db, savepoint=False):
+                obj_map = {_obj_key_getter(obj): obj for obj in batch}
+                written = []
+
+                # mass select for bulk_update on existing ones
+                if stable_batches and len(_match_fields) == 1:
+                    existing = _stable_filter(self, _match_fields[0].name, list(obj_map.keys()), batch_size)
+                else:
+                    existing = self.filter(_obj_filter(obj_map))
+                to_update = []
+                stale_objs = []
+                same_objs = []
+                for to_u in existing:
+                    obj = obj_map.pop(_obj_key_getter(to_u))
+                    if _update_if is not None and _is_stale(_update_if, to_u, obj):
+                        stale_objs.append(to_u)
+                        continue
+                    if nested and hasattr(obj, _NESTED_ATTR):
+                        written.append((getattr(obj, _NESTED_ATTR), to_u))
+                    if _same_values(_update_fields, to_u, obj):
+                        # nothing to write (nested objects are still synced)
+                        same_objs.append(to_u)
+                        continue
+                    for _f in _update_fields:
+                        # attname avoids fetching related objects for foreign keys
+                        setattr(to_u, _f.attname, getattr(obj, _f.attname))
+                    to_update.append(to_u)
+                to_create = list(obj_map.values())
+                pre_bulk_upsert.send(
+                    sender=self.model,
+                    created=to_create,
+                    updated=to_update,
+                    unchanged=same_objs + stale_objs,
+                    using=self.db,
+                )
 
-            # .create on the remaining (bulk_create won't work on multi-table inheritance models...)
-            created_objs = []
-            for obj in obj_map.values():
-                obj.save()
-                created_objs.append(obj)
-            if yield_objects:
-                yield created_objs, to_update
-        return created_objs, to_update
+                if stable_batches or _update_if is not None:
+                    if to_update:
+                        rejected = self.__bulk_update(
+                            to_update,
+                            _update_fields,
+                            stable_size=batch_size if stable_batches else None,
+                            update_if=_update_if,
+                        )
+                        if rejected:
+                            rejected_pks = {obj.pk for obj in rejected}
+                            to_update = [obj for obj in to_update if obj.pk not in rejected_pks]
+                            written = [(related, obj) for related, obj in written if obj.pk not in rejected_pks]
+                            stale_objs.extend(rejected)
+                else:
+                    self.bulk_update(to_update, update_fields)
+
+                # .save() on the remaining (bulk_create won't work on multi-table inheritance models...)
+                if send_row_signals:
+                    for obj in to_create:
+                        obj.save()
+                elif to_create:
+                    self.bulk_create(to_create)
+                    if to_create[0].pk is None:
+                        # backends that cannot return ids from bulk inserts (eg: MySQL), fetch them by match key
+                        created_map = {_obj_key_getter(obj): obj for obj in to_create}
+                        for stored_obj in self.filter(_obj_filter(created_map)):
+                            created_map[_obj_key_getter(stored_obj)].pk = stored_obj.pk
+                created_objs = to_create
+                for obj in created_objs:
+                    if nested and hasattr(obj, _NESTED_ATTR):
+                        written.append((getattr(obj, _NESTED_ATTR), obj))
+
+                if written:
+                    self.__bulk_update_or_create_nested(written, nested)
+
+            post_bulk_upsert.send(
+                sender=self.model,
+                created=created_objs,
+                updated=to_update,
+                unchanged=same_objs + stale_objs,
+                using=self.db,
+            )
+
+            # records already holding the values are still reported as updated, as they were before skipping them
+            updated_objs = to_update + same_objs
+            results = (created_objs, updated_objs) if _update_if is None else (created_objs, updated_objs, stale_objs)
+            if returning == 'objects':
+                yield results
+            elif returning == 'pks':
+                yield tuple([obj.pk for obj in result] for result in results)
+            elif returning == 'counts':
+                yield tuple(len(result) for result in results)
 
 
 class BulkUpdateOrCreateQuerySet(BulkUpdateOrCreateMixin, models.QuerySet):
@@ -188,7 +660,7 @@ class _BulkUpdateOrCreateContextManager:
         update_fields: List[str],
         batch_size: int = 500,
         status_cb: Optional[
-            Callable[[Tuple[List[Model], List[Model]]], Any]
+            Callable[[Tuple[Any, ...]], Any]
         ] = None,
         **kwargs: Optional[Any]
     ):
@@ -200,7 +672,12 @@ class _BulkUpdateOrCreateContextManager:
         self._fields = update_fields
         self._kwargs = kwargs
 
-    def queue(self, obj: Model):
+    def queue(self, obj: Model, **related: List[Any]):
+        """
+        :param related: related objects to attach to `obj` (see `with_related`), to be used with `nested`
+        """
+        if related:
+            with_related(obj, **related)
         self._queue.append(obj)
         if len(self._queue) >= self._batch_size:
             self.dump_queue()
@@ -221,12 +698,12 @@ class _BulkUpdateOrCreateContextManager:
             yield_objects=self._cb is not None,
             **self._kwargs,
         )
+        # reset queue before reporting so the batch is not kept alive by the callback
+        self._queue = []
         if self._cb is not None:
             for st in r:
                 self._cb(st)
 
-        self._queue = []
-
     def __enter__(self):
         return self
 
@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+# Sent once per batch of bulk_update_or_create, with arguments:
+#   sender - the model class
+#   created - objects (to be) created
+#   updated - existing objects (to be) updated
+#   unchanged - existing objects that are not updated: already holding the new values or stale (when using update_if)
+#   using - database alias
+pre_bulk_upsert = Signal()
+post_bulk_upsert = Signal()
@@ -1,6 +1,8 @@
+from random import Random
 from time import time
 
 from django.core.management.base import BaseCommand
+from django.db import connection
 
 from tests.models import RandomData
 from contextlib import contextmanager
@@ -29,6 +31,29 @@ class Command(BaseCommand):
         items = [RandomData(uuid=i + offset, data=str(i + offset + data_offset)) for i in range(n)]
         RandomData.objects.bulk_update_or_create(items, ['data'], match_field='uuid')
 
+    def _bulk_mixed(self, stable_batches, n=1000, batch_size=100):
+        # a random subset already exists, so the number of updates (and statement shapes) changes in every batch
+        self._clear()
+        rnd = Random(42)
+        RandomData.objects.bulk_create(RandomData(uuid=i, data=str(i)) for i in range(n) if rnd.random() < 0.5)
+        items = [RandomData(uuid=i, data=str(i + 1)) for i in range(n)]
+
+        statements = set()
+
+        def _wrapper(execute, sql, params, many, context):
+            statements.add(sql)
+            return execute(sql, params, many, context)
+
+        with timing(f'bulk_update_or_create - mixed batches (stable_batches={stable_batches})'):
+            with connection.execute_wrapper(_wrapper):
+                RandomData.objects.bulk_update_or_create(
+                    items, ['data'], match_field='uuid', batch_size=batch_size, stable_batches=stable_batches
+                )
+        self._check(n, 1, n)
+        # statements compiled by the sqlite3 statement cache (or prepared by psycopg 3 with server-side binding),
+        # drivers binding parameters on the client (psycopg2, mysqlclient) still send different SQL text per batch
+        print(f'  distinct SQL templates: {len(statements)}')
+
     def _clear(self):
         RandomData.objects.all().delete()
 
@@ -66,3 +91,6 @@ class Command(BaseCommand):
         with timing('bulk_update_or_create - half half'):
             self._bulk(offset=500, data_offset=2)
         self._check(1500, 1, 1501)
+
+        self._bulk_mixed(stable_batches=False)
+        self._bulk_mixed(stable_batches=True)
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0002_parentdata_childdata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagData',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='parentdata',
+            name='tags',
+            field=models.ManyToManyField(blank=True, to='tests.TagData'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0003_tagdata_parentdata_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabelData',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.IntegerField()),
+                (
+                    'parent',
+                    models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tests.ParentData'),
+                ),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tests.TagData')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='parentdata',
+            name='labels',
+            field=models.ManyToManyField(
+                blank=True, related_name='labelled', through='tests.LabelData', to='tests.TagData'
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0004_labeldata_parentdata_labels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parentdata',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0005_parentdata_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tagdata',
+            name='related',
+            field=models.ManyToManyField(blank=True, to='tests.TagData'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0006_tagdata_related'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtendedData',
+            fields=[
+                (
+                    'randomdata_ptr',
+                    models.OneToOneField(
+                        auto_created=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        parent_link=True,
+                        primary_key=True,
+                        serialize=False,
+                        to='tests.RandomData',
+                    ),
+                ),
+                ('extra', models.CharField(blank=True, max_length=50, null=True)),
+            ],
+            bases=('tests.randomdata',),
+        ),
+    ]
@@ -11,3 +11,45 @@ class RandomData(models.Model):
 
     def __str__(self):
         return f'{self.uuid} - {self.data} - {self.value}'
+
+
+class ExtendedData(RandomData):
+    extra = models.CharField(max_length=50, null=True, blank=True)
+
+
+class TagData(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    related = models.ManyToManyField('self', blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ParentData(models.Model):
+    objects = BulkUpdateOrCreateQuerySet.as_manager()
+
+    ext_id = models.CharField(max_length=50, unique=True)
+    data = models.CharField(max_length=200, null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    tags = models.ManyToManyField(TagData, blank=True)
+    labels = models.ManyToManyField(TagData, blank=True, through='LabelData', related_name='labelled')
+
+    def __str__(self):
+        return f'{self.ext_id} - {self.data}'
+
+
+class ChildData(models.Model):
+    objects = BulkUpdateOrCreateQuerySet.as_manager()
+
+    parent = models.ForeignKey(ParentData, on_delete=models.CASCADE, related_name='children')
+    uuid = models.IntegerField(unique=True)
+    data = models.CharField(max_length=200, null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.uuid} - {self.data}'
+
+
+class LabelData(models.Model):
+    parent = models.ForeignKey(ParentData, on_delete=models.CASCADE)
+    tag = models.ForeignKey(TagData, on_delete=models.CASCADE)
+    weight = models.IntegerField()
@@ -1,7 +1,22 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import tempfile
+import warnings
+from io import StringIO
+from unittest import mock
+
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase
 from django.core.exceptions import FieldDoesNotExist
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models.signals import post_save, pre_save
 
-from tests.models import RandomData
+from bulk_update_or_create import BulkUpdateOrCreateQuerySet, loader, with_related
+from bulk_update_or_create.signals import post_bulk_upsert, pre_bulk_upsert
+from tests.models import ChildData, ExtendedData, ParentData, RandomData, TagData
 
 
 class Test(TestCase):
@@ -257,3 +272,520 @@ class Test(TestCase):
             list(x.uuid for x in RandomData.objects.order_by('data', 'value')),
             list(range(100, 110)),
         )
+
+    def test_returning(self):
+        self.test_all_create()
+        items = [RandomData(uuid=i + 5, data=i + 10) for i in range(10)]
+        r = RandomData.objects.bulk_update_or_create(items, ['data'], match_field='uuid', returning='counts')
+        # one batch, 5 created and 5 updated
+        self.assertEqual(r, [(5, 5)])
+
+        items = [RandomData(uuid=i + 10, data=i + 30) for i in range(10)]
+        r = RandomData.objects.bulk_update_or_create(
+            items, ['data'], match_field='uuid', batch_size=5, returning='pks', yield_objects=True
+        )
+        r = list(r)
+        self.assertEqual(len(r), 2)
+        existing = dict(RandomData.objects.values_list('uuid', 'pk'))
+        self.assertEqual(sorted(r[0][1]), [existing[i] for i in range(10, 15)])
+        self.assertEqual(r[0][0], [])
+        self.assertEqual(sorted(r[1][0]), [existing[i] for i in range(15, 20)])
+        self.assertEqual(r[1][1], [])
+
+        r = RandomData.objects.bulk_update_or_create(
+            [RandomData(uuid=1, data=1)], ['data'], match_field='uuid', returning='none', yield_objects=True
+        )
+        self.assertEqual(list(r), [])
+        # default without yield_objects is "none"
+        r = RandomData.objects.bulk_update_or_create([RandomData(uuid=1, data=1)], ['data'], match_field='uuid')
+        self.assertEqual(r, [])
+
+        with self.assertRaises(ValueError) as cm:
+            RandomData.objects.bulk_update_or_create([], ['data'], returning='x')
+        self.assertEqual(cm.exception.args, ('returning must be one of none, counts, pks, objects.',))
+
+    def test_context_manager_returning(self):
+        cb_calls = []
+        with RandomData.objects.bulk_update_or_create_context(
+            ['data'], match_field='uuid', batch_size=3, status_cb=cb_calls.append, returning='counts'
+        ) as bulkit:
+            for i in range(10):
+                bulkit.queue(RandomData(uuid=i, data=i))
+        self.assertEqual(cb_calls, [(3, 0), (3, 0), (3, 0), (1, 0)])
+
+        with self.assertRaises(ValueError) as cm:
+            RandomData.objects.bulk_update_or_create_context(
+                ['data'], match_field='uuid', status_cb=cb_calls.append, returning='none'
+            )
+        self.assertEqual(cm.exception.args, ('returning cannot be "none" when using status_cb.',))
+
+    def test_fk_lookups(self):
+        ParentData.objects.bulk_create([ParentData(ext_id=f'P{i}') for i in range(3)])
+        parents = dict(ParentData.objects.values_list('ext_id', 'pk'))
+        items = [ChildData(uuid=i, parent_id=f'P{i % 3}', data=i) for i in range(10)]
+        # 1 fk select, 1 select + 10 creates
+        with self.assertNumQueries(12):
+            ChildData.objects.bulk_update_or_create(
+                items, ['data', 'parent'], match_field='uuid', fk_lookups={'parent': 'ext_id'}
+            )
+        self.assertEqual(
+            list(ChildData.objects.order_by('uuid').values_list('parent_id', flat=True)),
+            [parents[f'P{i % 3}'] for i in range(10)],
+        )
+
+        items = [ChildData(uuid=i, parent_id='P0', data=i) for i in range(10)]
+        with self.assertRaises(ParentData.DoesNotExist):
+            ChildData.objects.bulk_update_or_create(
+                items + [ChildData(uuid=10, parent_id='P9')],
+                ['parent'],
+                match_field='uuid',
+                fk_lookups={'parent': 'ext_id'},
+            )
+        # 1 fk select, 1 select, 1 bulk update
+        with self.assertNumQueries(3):
+            ChildData.objects.bulk_update_or_create(
+                items, ['parent'], match_field='uuid', fk_lookups={'parent': 'ext_id'}
+            )
+        self.assertEqual(ChildData.objects.filter(parent_id=parents['P0']).count(), 10)
+
+        with self.assertRaises(ValueError) as cm:
+            ChildData.objects.bulk_update_or_create(
+                items, ['parent'], match_field='uuid', fk_lookups={'data': 'ext_id'}
+            )
+        self.assertEqual(cm.exception.args, ('fk_lookups can only be used with foreign key fields.',))
+        with self.assertRaises(ValueError) as cm:
+            ChildData.objects.bulk_update_or_create(
+                items, ['parent'], match_field='uuid', fk_lookups={'parent': 'data'}
+            )
+        self.assertEqual(cm.exception.args, ('fk_lookups can only be used with unique fields of the related model.',))
+
+    def test_fk_lookups_case_insensitive(self):
+        ParentData.objects.create(ext_id='P0')
+        fk_cache = {}
+        ChildData.objects.bulk_update_or_create(
+            [ChildData(uuid=0, parent_id='P0')],
+            ['parent'],
+            match_field='uuid',
+            fk_lookups={'parent': 'ext_id'},
+            fk_cache=fk_cache,
+            case_insensitive_match=True,
+        )
+        # "p0" matches "P0" with "ci" collations, it must be found in the cache instead of being missing
+        # 1 select + 1 create, no fk select
+        with self.assertNumQueries(2):
+            ChildData.objects.bulk_update_or_create(
+                [ChildData(uuid=1, parent_id='p0')],
+                ['parent'],
+                match_field='uuid',
+                fk_lookups={'parent': 'ext_id'},
+                fk_cache=fk_cache,
+                case_insensitive_match=True,
+            )
+        self.assertEqual(ChildData.objects.get(uuid=1).parent.ext_id, 'P0')
+
+    def test_fk_lookups_context_manager(self):
+        ParentData.objects.create(ext_id='P0')
+        # batch 1 (P0 exists): 1 fk select, 1 select + 3 creates
+        # batch 2 (P1 missing): 1 fk select, 1 fk bulk create + 1 fk select, 1 select + 3 creates
+        # batch 3 (P9 missing): 1 fk select, 1 fk bulk create + 1 fk select, 1 select + 2 creates
+        with self.assertNumQueries(18):
+            with ChildData.objects.bulk_update_or_create_context(
+                ['data'], match_field='uuid', batch_size=3, fk_lookups={'parent': 'ext_id'}, create_missing_fks=True
+            ) as bulkit:
+                for i in range(8):
+                    bulkit.queue_obj(uuid=i, parent_id=f'P{i // 3}' if i < 6 else 'P9', data=i)
+        self.assertEqual(
+            sorted(ParentData.objects.values_list('ext_id', flat=True)),
+            ['P0', 'P1', 'P9'],
+        )
+        self.assertEqual(
+            sorted(ChildData.objects.values_list('parent__ext_id', 'uuid')),
+            [('P0', 0), ('P0', 1), ('P0', 2), ('P1', 3), ('P1', 4), ('P1', 5), ('P9', 6), ('P9', 7)],
+        )
+
+    def test_nested(self):
+        TagData.objects.bulk_create([TagData(name=f't{i}') for i in range(3)])
+        tags = list(TagData.objects.order_by('name'))
+        nested = {'children': {'update_fields': ['data'], 'match_field': 'uuid'}, 'tags': {}}
+        items = [
+            with_related(
+                ParentData(ext_id=f'P{i}', data=i),
+                children=[ChildData(uuid=i * 10 + j, data=j) for j in range(2)],
+                tags=tags[: i + 1],
+            )
+            for i in range(3)
+        ]
+        # 1 select + 3 creates, children: 1 select + 6 creates, tags: 1 select + 1 bulk create
+        with self.assertNumQueries(13):
+            ParentData.objects.bulk_update_or_create(items, ['data'], match_field='ext_id', nested=nested)
+        self.assertEqual(
+            sorted(ChildData.objects.values_list('parent__ext_id', 'uuid')),
+            [('P0', 0), ('P0', 1), ('P1', 10), ('P1', 11), ('P2', 20), ('P2', 21)],
+        )
+        self.assertEqual(
+            sorted(ParentData.tags.through.objects.values_list('parentdata__ext_id', 'tagdata__name')),
+            [('P0', 't0'), ('P1', 't0'), ('P1', 't1'), ('P2', 't0'), ('P2', 't1'), ('P2', 't2')],
+        )
+
+        items = [
+            with_related(ParentData(ext_id='P0', data='x'), children=[ChildData(uuid=0, data='y')], tags=[tags[2].pk]),
+            with_related(ParentData(ext_id='P2', data='x'), tags=[tags[0], tags[1]]),
+            ParentData(ext_id='P1', data='x'),
+        ]
+        # 1 select, 1 bulk update, children: 1 select + 1 bulk update, tags: 1 select + 1 delete + 1 bulk create
+        with self.assertNumQueries(7):
+            ParentData.objects.bulk_update_or_create(items, ['data'], match_field='ext_id', nested=nested)
+        self.assertEqual(list(ChildData.objects.order_by('uuid').values_list('data', flat=True)[:2]), ['y', '1'])
+        self.assertEqual(
+            sorted(ParentData.tags.through.objects.values_list('parentdata__ext_id', 'tagdata__name')),
+            [('P0', 't2'), ('P1', 't0'), ('P1', 't1'), ('P2', 't0'), ('P2', 't1')],
+        )
+
+        with self.assertRaises(ValueError) as cm:
+            ParentData.objects.bulk_update_or_create(items, ['data'], match_field='ext_id', nested={'data': {}})
+        self.assertEqual(
+            cm.exception.args, ('nested can only be used with reverse foreign keys and many to many fields.',)
+        )
+
+        with self.assertRaises(ValueError) as cm:
+            ParentData.objects.bulk_update_or_create(items, ['data'], match_field='ext_id', nested={'labels': {}})
+        self.assertEqual(
+            cm.exception.args, ('nested cannot be used with many to many fields using a custom through model.',)
+        )
+
+        with self.assertRaises(ValueError) as cm:
+            BulkUpdateOrCreateQuerySet(model=TagData).bulk_update_or_create(
+                [TagData(name='t0')], ['name'], match_field='name', nested={'related': {}}
+            )
+        self.assertEqual(cm.exception.args, ('nested cannot be used with symmetrical many to many fields.',))
+
+    def test_nested_atomic(self):
+        tag = TagData.objects.create(name='t0')
+        items = [
+            with_related(ParentData(ext_id='P0'), tags=[tag]),
+            with_related(ParentData(ext_id='P1'), tags=[TagData(name='t1')]),
+        ]
+        # rejected before anything is written
+        with self.assertNumQueries(0), self.assertRaises(ValueError) as cm:
+            ParentData.objects.bulk_update_or_create(items, ['data'], match_field='ext_id', nested={'tags': {}})
+        self.assertEqual(cm.exception.args, ('nested tags objects must be saved before they can be linked.',))
+
+    def test_nested_context_manager(self):
+        tag = TagData.objects.create(name='t0')
+        with ParentData.objects.bulk_update_or_create_context(
+            ['data'], match_field='ext_id', batch_size=2, nested={'tags': {'remove': False}}
+        ) as bulkit:
+            for i in range(3):
+                bulkit.queue(ParentData(ext_id=f'P{i}'), tags=[tag])
+        self.assertEqual(tag.parentdata_set.count(), 3)
+
+    def _write_file(self, name, content, compress=False):
+        path = os.path.join(self._tmpdir(), name)
+        with gzip.open(path, 'wt') if compress else open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _tmpdir(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        return tmpdir.name
+
+    def test_load_csv(self):
+        self.test_all_create()
+        path = self._write_file('data.csv', 'uuid,data,extra\n' + ''.join(f'{i + 5},{i + 10},x\n' for i in range(10)))
+        progress = []
+        total = loader.load(RandomData, path, ['data'], match_field='uuid', batch_size=4, progress_cb=progress.append)
+        self.assertEqual(
+            [(p.batch, p.rows, p.created, p.updated) for p in progress], [(1, 4, 0, 4), (2, 8, 3, 5), (3, 10, 5, 5)]
+        )
+        self.assertEqual((total.rows, total.created, total.updated), (10, 5, 5))
+        self.assertEqual(
+            sorted(int(x.data) for x in RandomData.objects.all()),
+            list(range(5)) + list(range(10, 20)),
+        )
+
+    def test_load_jsonl_gzip_parallel(self):
+        path = self._write_file(
+            'data.jsonl.gz',
+            ''.join(json.dumps({'id': str(i), 'name': f'd{i}'}) + '\n' for i in range(10)),
+            compress=True,
+        )
+        total = loader.load(
+            RandomData,
+            path,
+            ['data'],
+            match_field='uuid',
+            fields={'uuid': ('id', int), 'data': 'name'},
+            parallel=True,
+        )
+        self.assertEqual((total.batch, total.created), (1, 10))
+        self.assertEqual(sorted(RandomData.objects.values_list('uuid', 'data')), [(i, f'd{i}') for i in range(10)])
+
+        with self.assertRaises(ValueError):
+            list(loader.iter_rows(path + '.txt'))
+
+    def test_bulk_load_command(self):
+        path = self._write_file('data', 'id;name\n1;a\n2;\n')
+        out = StringIO()
+        call_command(
+            'bulk_load',
+            'tests.RandomData',
+            path,
+            '--update-fields=data',
+            '--match-field=uuid',
+            '--map=uuid=id',
+            '--map=data=name',
+            '--format=csv',
+            '--delimiter=;',
+            stdout=out,
+        )
+        self.assertIn('batch 1: 2 created, 0 updated, 0 stale, 2 rows', out.getvalue())
+        self.assertEqual(sorted(RandomData.objects.values_list('uuid', 'data')), [(1, 'a'), (2, None)])
+
+        with self.assertRaises(CommandError):
+            call_command('bulk_load', 'tests.Nope', path, '--update-fields=data')
+
+        path = self._write_file(
+            'data.jsonl', '{"uuid": 1, "data": "b", "value": 0}\n{"uuid": 2, "data": "c", "value": 1}\n'
+        )
+        out = StringIO()
+        call_command(
+            'bulk_load',
+            'tests.RandomData',
+            path,
+            '--update-fields=data,value',
+            '--match-field=uuid',
+            '--update-if=value',
+            stdout=out,
+        )
+        self.assertIn('done: 0 created, 1 updated, 1 stale, 2 rows', out.getvalue())
+        self.assertEqual(sorted(RandomData.objects.values_list('uuid', 'data')), [(1, 'a'), (2, 'c')])
+
+        path = self._write_file('bad.csv', 'uuid,data\n3,a\nabc,b\n')
+        with self.assertRaises(CommandError) as cm:
+            call_command('bulk_load', 'tests.RandomData', path, '--update-fields=data', '--match-field=uuid')
+        self.assertIn('Invalid uuid for uuid in row 2: ', str(cm.exception))
+
+    def test_stable_batches(self):
+        self.test_all_create()
+
+        def _statements(stable_batches):
+            statements = set()
+
+            def _wrapper(execute, sql, params, many, context):
+                statements.add(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(_wrapper):
+                for n in (5, 6, 7):
+                    items = [RandomData(uuid=i, data=i + n) for i in range(n)]
+                    RandomData.objects.bulk_update_or_create(
+                        items, ['data', 'value'], match_field='uuid', batch_size=8, stable_batches=stable_batches
+                    )
+            return statements
+
+        # one SELECT and one UPDATE per batch size
+        self.assertEqual(len(_statements(False)), 6)
+        self.assertEqual(sorted(int(x.data) for x in RandomData.objects.all()), [7, 7, 8, 8, 9, 9, 10, 11, 12, 13])
+        # same SELECT and UPDATE for all (padded to 8)
+        self.assertEqual(len(_statements(True)), 2)
+        self.assertEqual(sorted(int(x.data) for x in RandomData.objects.all()), [7, 7, 8, 8, 9, 9, 10, 11, 12, 13])
+
+        # creates still work and padding is not reported
+        items = [RandomData(uuid=i + 8, data=i) for i in range(3)]
+        r = RandomData.objects.bulk_update_or_create(
+            items, ['data'], match_field='uuid', batch_size=8, stable_batches=True, returning='counts'
+        )
+        self.assertEqual(r, [(1, 2)])
+        self.assertEqual(RandomData.objects.count(), 11)
+
+    def test_update_if(self):
+        RandomData.objects.bulk_create([RandomData(uuid=i, value=5, data='old') for i in range(10)])
+        items = [RandomData(uuid=i, value=i, data='new') for i in range(12)]
+        r = RandomData.objects.bulk_update_or_create(
+            items, ['data', 'value'], match_field='uuid', update_if='value', returning='counts'
+        )
+        # 2 created, 4 updated (6 to 9), 6 stale (0 to 5)
+        self.assertEqual(r, [(2, 4, 6)])
+        self.assertEqual(
+            list(RandomData.objects.order_by('uuid').values_list('data', 'value')),
+            [('old', 5)] * 6 + [('new', i) for i in range(6, 12)],
+        )
+
+        r = RandomData.objects.bulk_update_or_create(
+            [RandomData(uuid=0, value=1), RandomData(uuid=1, value=6)],
+            ['data', 'value'],
+            match_field='uuid',
+            update_if='value',
+            returning='pks',
+        )
+        pks = dict(RandomData.objects.values_list('uuid', 'pk'))
+        self.assertEqual(r, [([], [pks[1]], [pks[0]])])
+
+        with self.assertRaises(ValueError) as cm:
+            RandomData.objects.bulk_update_or_create(items, ['data'], match_field='uuid', update_if='value')
+        self.assertEqual(cm.exception.args, ('update_if must be one of update_fields.',))
+
+    def test_update_if_where_clause(self):
+        RandomData.objects.bulk_create([RandomData(uuid=i, value=5, data='old') for i in range(4)])
+
+        def _concurrent_write(execute, sql, params, many, context):
+            if sql.startswith('UPDATE') and not written:
+                # newer (and same) version written by someone else after the SELECT
+                written.append(True)
+                RandomData.objects.filter(uuid=3).update(value=100, data='newer')
+                RandomData.objects.filter(uuid=2).update(value=10, data='same')
+            return execute(sql, params, many, context)
+
+        items = [RandomData(uuid=i, value=10, data='new') for i in range(4)]
+        for stable_batches in (False, True):
+            written = []
+            with connection.execute_wrapper(_concurrent_write):
+                r = RandomData.objects.bulk_update_or_create(
+                    items,
+                    ['data', 'value'],
+                    match_field='uuid',
+                    update_if='value',
+                    stable_batches=stable_batches,
+                    returning='objects',
+                )
+            # rejected by the UPDATE guard, reported as stale with the stored values
+            self.assertEqual([len(x) for x in r[0]], [0, 2, 2])
+            self.assertEqual(
+                sorted((x.uuid, x.value, x.data) for x in r[0][2]), [(2, 10, 'same'), (3, 100, 'newer')]
+            )
+            self.assertEqual(
+                list(RandomData.objects.order_by('uuid').values_list('data', 'value')),
+                [('new', 10)] * 2 + [('same', 10), ('newer', 100)],
+            )
+            RandomData.objects.update(value=5)
+
+    def _connect(self, signal):
+        calls = []
+
+        def _receiver(sender, **kwargs):
+            calls.append((sender, kwargs))
+
+        signal.connect(_receiver, sender=RandomData)
+        self.addCleanup(signal.disconnect, _receiver, sender=RandomData)
+        return calls
+
+    def test_bulk_signals(self):
+        RandomData.objects.bulk_create([RandomData(uuid=i, value=5, data=i) for i in range(5)])
+        pre_calls = self._connect(pre_bulk_upsert)
+        post_calls = self._connect(post_bulk_upsert)
+        row_calls = self._connect(post_save)
+
+        items = [RandomData(uuid=i, value=i, data=i + 10) for i in range(8)]
+        RandomData.objects.bulk_update_or_create(items, ['data', 'value'], match_field='uuid', batch_size=4)
+        # once per batch
+        self.assertEqual([len(kwargs['created']) for _, kwargs in pre_calls], [0, 3])
+        self.assertEqual([len(kwargs['updated']) for _, kwargs in post_calls], [4, 1])
+        self.assertEqual(len(row_calls), 3)
+        self.assertEqual(post_calls[1][0], RandomData)
+        self.assertEqual(post_calls[1][1]['unchanged'], [])
+        self.assertEqual(sorted(int(x.data) for x in post_calls[1][1]['created']), [15, 16, 17])
+        for x in post_calls[1][1]['created']:
+            self.assertIsNotNone(x.pk)
+
+        del pre_calls[:], post_calls[:], row_calls[:]
+        items = [RandomData(uuid=i, value=7, data=i + 20) for i in range(10)]
+        # 1 select, 1 bulk update, 1 bulk create (not 2 inserts) + 1 select for pks if not returned by the insert
+        with self.assertNumQueries(3 if getattr(connection.features, 'can_return_rows_from_bulk_insert', False) else 4):
+            RandomData.objects.bulk_update_or_create(
+                items, ['data', 'value'], match_field='uuid', update_if='value', send_row_signals=False
+            )
+        self.assertEqual(len(pre_calls), 1)
+        self.assertEqual(row_calls, [])
+        _, kwargs = post_calls[0]
+        self.assertEqual(sorted(x.uuid for x in kwargs['created']), [8, 9])
+        self.assertEqual(sorted(x.uuid for x in kwargs['updated']), [0, 1, 2, 3, 4, 5, 6])
+        self.assertEqual([x.uuid for x in kwargs['unchanged']], [7])
+        for x in kwargs['created']:
+            self.assertIsNotNone(x.pk)
+        self.assertEqual(RandomData.objects.count(), 10)
+
+        del pre_calls[:], post_calls[:]
+        items = [RandomData(uuid=0, value=7, data=20), RandomData(uuid=1, value=7, data='x')]
+        # 1 select, 1 bulk update (only the changed record)
+        with self.assertNumQueries(2):
+            r = RandomData.objects.bulk_update_or_create(
+                items, ['data', 'value'], match_field='uuid', returning='counts'
+            )
+        self.assertEqual(r, [(0, 2)])
+        for _, kwargs in pre_calls + post_calls:
+            self.assertEqual([x.uuid for x in kwargs['updated']], [1])
+            self.assertEqual([x.uuid for x in kwargs['unchanged']], [0])
+
+        with self.assertRaises(ValueError) as cm:
+            ExtendedData.objects.bulk_update_or_create(
+                [ExtendedData(uuid=20)], ['data'], match_field='uuid', send_row_signals=False
+            )
+        self.assertEqual(
+            cm.exception.args, ('send_row_signals=False cannot be used with multi-table inheritance models.',)
+        )
+
+    def test_load_rows(self):
+        # keys only in later rows are used, keys missing from a row keep the model default
+        path = self._write_file(
+            'data.jsonl', '{"uuid": 50, "data": "a", "value": 3}\n{"uuid": 51, "data": "b"}\n{"uuid": 52, "value": 4}\n'
+        )
+        loader.load(RandomData, path, ['data', 'value'], match_field='uuid')
+        self.assertEqual(
+            list(RandomData.objects.order_by('uuid').values_list('uuid', 'data', 'value')),
+            [(50, 'a', 3), (51, 'b', 0), (52, None, 4)],
+        )
+
+        # rows are counted as read, even if they share the match key
+        path = self._write_file('data.csv', 'uuid,data\n1,a\n2,b\n1,c\n')
+        total = loader.load(RandomData, path, ['data'], match_field='uuid')
+        self.assertEqual((total.rows, total.created, total.updated), (3, 2, 0))
+
+        # UTF-8 BOM is not part of the first header
+        path = self._write_file('bom.csv', '\ufeffuuid,data\n60,x\n')
+        loader.load(RandomData, path, ['data'], match_field='uuid')
+        self.assertEqual(RandomData.objects.get(uuid=60).data, 'x')
+
+    def test_update_if_datetime(self):
+        stored = datetime.datetime(2021, 1, 1, 12, tzinfo=datetime.timezone.utc)
+        ParentData.objects.bulk_create([ParentData(ext_id=f'P{i}', data='old', updated_at=stored) for i in range(4)])
+        items = [
+            # aware, naive (default timezone is UTC) and string values, as loaded from CSV
+            ParentData(ext_id='P0', data='new', updated_at=stored + datetime.timedelta(hours=1)),
+            ParentData(ext_id='P1', data='new', updated_at=datetime.datetime(2020, 1, 1)),
+            ParentData(ext_id='P2', data='new', updated_at='2021-01-01 13:00'),
+            ParentData(ext_id='P3', data='new', updated_at='2021-01-01 12:00'),
+        ]
+        with warnings.catch_warnings():
+            # naive datetimes warn, same as when saving them
+            warnings.simplefilter('ignore', RuntimeWarning)
+            r = ParentData.objects.bulk_update_or_create(
+                items, ['data', 'updated_at'], match_field='ext_id', update_if='updated_at', returning='counts'
+            )
+        self.assertEqual(r, [(0, 2, 2)])
+        self.assertEqual(
+            list(ParentData.objects.order_by('ext_id').values_list('data', flat=True)), ['new', 'old', 'new', 'old']
+        )
+
+    def test_bulk_create_without_returning_ids(self):
+        pre_calls = self._connect(pre_save)
+        items = [RandomData(uuid=i, data=i) for i in range(5)]
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False, create=True):
+            # 1 select, 1 bulk create, 1 select to fetch the new pks
+            with self.assertNumQueries(3):
+                r = RandomData.objects.bulk_update_or_create(
+                    items, ['data'], match_field='uuid', send_row_signals=False, returning='pks'
+                )
+        self.assertEqual(pre_calls, [])
+        self.assertEqual(r, [([RandomData.objects.get(uuid=i).pk for i in range(5)], [])])
+
+
+class TransactionTest(TransactionTestCase):
+    def test_nested_atomic(self):
+        # a failing nested write (uuid already used) does not leave the parents behind
+        ChildData.objects.create(parent=ParentData.objects.create(ext_id='Q'), uuid=0, data='a')
+        items = [with_related(ParentData(ext_id='P0'), children=[ChildData(uuid=0, data='b')])]
+        nested = {'children': {'update_fields': ['uuid'], 'match_field': 'data'}}
+        with self.assertRaises(IntegrityError):
+            ParentData.objects.bulk_update_or_create(items, ['data'], match_field='ext_id', nested=nested)
+        self.assertEqual(list(ParentData.objects.values_list('ext_id', flat=True)), ['Q'])